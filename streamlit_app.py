@@ -1,3 +1,5 @@
+import os
+
 import streamlit as st
 import pandas as pd
 import numpy as np
@@ -12,7 +14,8 @@ st.set_page_config(
     layout="wide"
 )
 
-DATA_PATH = "processed_data.csv"
+CSV_PATH = "processed_data.csv"
+DATA_PATH = "processed_data.parquet"
 
 OUTCOME_COLS = [
     "Heart_Attack",
@@ -61,6 +64,16 @@ DEMOGRAPHIC_COLS = [
     "Income_to_Poverty_Ratio",
 ]
 
+# Columns filtered by the sidebar widgets, in compute_filtered order
+RANGE_FILTER_COLS = ["Age", "Income_to_Poverty_Ratio"] + LIFESTYLE_COLS
+CATEGORY_FILTER_COLS = ["Ethnicity", "Education_Level"]
+
+# Bound on entries per filter-keyed cache, so slider drags cannot grow it forever
+FILTER_CACHE_ENTRIES = 64
+
+# Largest number of participants drawn as points over the boxplots
+MAX_JITTER_POINTS = 5000
+
 
 # -----------------------------
 # Helpers
@@ -69,34 +82,185 @@ def nice_label(name: str) -> str:
     return name.replace("_", " ")
 
 
-@st.cache_data
-def load_data(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
+def nice_bin_extent(lo: float, hi: float, maxbins: int = 15) -> tuple:
+    # Same start/stop/step as Vega's bin transform (base 10, divide [5, 2])
+    span = (hi - lo) or abs(lo) or 1
+    level = np.ceil(np.log10(maxbins))
+    step = 10 ** (np.floor(np.log10(span) + 0.5) - level)
+    while np.ceil(span / step) > maxbins:
+        step *= 10
+    for div in (5, 2):
+        if span / (step / div) <= maxbins:
+            step /= div
+
+    v = np.log10(step)
+    precision = 0 if v >= 0 else int(-v) + 1
+    eps = 10.0 ** (-precision - 1)
+    start = np.floor(lo / step + eps) * step
+    start = start - step if lo < start else start
+    stop = np.ceil(hi / step) * step
+    return start, (stop if stop != start else start + step), step
+
+
+def lifestyle_bins(values: np.ndarray, maxbins: int = 15) -> tuple:
+    # Bin starts and the bin index of each value, matching alt.Bin(maxbins=...)
+    start, stop, step = nice_bin_extent(values.min(), values.max(), maxbins)
+    starts = start + step * np.arange(int(round((stop - start) / step)))
+    # Same index as Vega: the top value is clamped into the last bin, and a
+    # small epsilon keeps float noise from dropping a value one bin down
+    clamped = np.clip(values, start, stop - step)
+    return starts, np.floor((clamped - start) / step + 1e-14).astype(int)
+
+
+def box_summary(df: pd.DataFrame, value: str, by: list) -> pd.DataFrame:
+    # Quartiles and 1.5 IQR whisker ends per group, as drawn by mark_boxplot
+    stats = df.groupby(by, observed=True)[value].describe(percentiles=[0.25, 0.5, 0.75])
+    stats = stats.rename(columns={"25%": "q1", "50%": "median", "75%": "q3"})
+    iqr = stats["q3"] - stats["q1"]
+    fences = pd.DataFrame(
+        {"lo": stats["q1"] - 1.5 * iqr, "hi": stats["q3"] + 1.5 * iqr}
+    )
+
+    rows = df.join(fences, on=by)
+    inside = rows[value].where(rows[value].between(rows["lo"], rows["hi"]))
+    whiskers = inside.groupby([rows[c] for c in by], observed=True).agg(["min", "max"])
+    stats["lower"] = whiskers["min"]
+    stats["upper"] = whiskers["max"]
+
+    return stats[["count", "lower", "q1", "median", "q3", "upper"]].reset_index()
+
+
+def active_range(selected: tuple, lo: float, hi: float):
+    # None when the selected range covers every value in [lo, hi]; rows
+    # missing the value are already dropped by load_data
+    return None if selected[0] <= lo and selected[1] >= hi else selected
+
+
+def active_selection(selected: list, options: frozenset):
+    # None when nothing or everything is selected. Either way no filter is
+    # applied, so rows with a missing category stay in even when every
+    # option is selected (isin over all options used to drop them)
+    if not selected or set(selected) == options:
+        return None
+    return tuple(selected)
+
+
+def convert_to_parquet(csv_path: str, parquet_path: str) -> None:
+    df = pd.read_csv(csv_path)
 
     # Drop index column if present
     if "Unnamed: 0" in df.columns:
         df = df.drop(columns=["Unnamed: 0"])
 
-    # Ensure outcomes are strings
-    for col in OUTCOME_COLS:
-        df[col] = df[col].astype(str)
+    df.to_parquet(parquet_path, compression="zstd", index=False)
+
+
+def load_data(path: str) -> pd.DataFrame:
+    # Convert the CSV export to Parquet when missing or older than the CSV
+    if not os.path.exists(path) or (
+        os.path.exists(CSV_PATH)
+        and os.path.getmtime(CSV_PATH) > os.path.getmtime(path)
+    ):
+        convert_to_parquet(CSV_PATH, path)
+
+    # Only read the columns the dashboard uses
+    df = pd.read_parquet(
+        path,
+        engine="pyarrow",
+        columns=OUTCOME_COLS + LIFESTYLE_COLS + METABOLIC_COLS + DEMOGRAPHIC_COLS,
+    )
+
+    # The range sliders always excluded missing values, even at full range,
+    # so those rows are dropped once here rather than on every filter pass
+    df = df.dropna(subset=RANGE_FILTER_COLS).reset_index(drop=True)
 
-    # Create comorbidity summary variables
-    outcome_yes = df[OUTCOME_COLS].apply(lambda c: c.str.upper().eq("YES"))
-    df["Comorbidity_Count"] = outcome_yes.sum(axis=1)
-    df["Any_Comorbidity"] = np.where(df["Comorbidity_Count"] > 0, "Yes", "No")
+    # Encode outcomes once as categoricals
+    df[OUTCOME_COLS] = df[OUTCOME_COLS].astype(str).astype("category")
+
+    # Create comorbidity summary variables from the category codes
+    codes = np.stack([df[c].cat.codes.to_numpy() for c in OUTCOME_COLS], axis=1)
+    yes_codes = np.array(
+        [df[c].cat.categories.get_indexer(["Yes"])[0] for c in OUTCOME_COLS]
+    )
+    # A column with no "Yes" level gets -1, the code of missing values too
+    outcome_yes = (codes == yes_codes) & (yes_codes >= 0)
+    df["Comorbidity_Count"] = outcome_yes.sum(axis=1).astype(np.int8)
+    df["Any_Comorbidity_Bool"] = outcome_yes.any(axis=1)
+
+    # Keep outcomes as the boolean Yes mask so later passes are plain reductions
+    df[OUTCOME_COLS] = outcome_yes
+
+    # Narrow numeric dtypes so filter passes scan fewer bytes
+    for col in METABOLIC_COLS:
+        df[col] = pd.to_numeric(df[col], downcast="float")
+    for col in ["Age"] + LIFESTYLE_COLS:
+        df[col] = pd.to_numeric(df[col], downcast="integer")
+    for col in ["Gender", "Ethnicity", "Education_Level"]:
+        df[col] = df[col].astype("category")
 
     return df
 
 
-def apply_filters(df: pd.DataFrame) -> pd.DataFrame:
+@st.cache_resource(show_spinner=False)
+def load_shared(path: str) -> tuple:
+    # One frame shared by every session, plus NumPy arrays of the filter
+    # columns (category codes for the multiselect ones) and the widget
+    # stats: (min, max) per slider column and the options per multiselect.
+    # All are read-only: never mutate them in place.
+    df = load_data(path)
+    arrays = {col: df[col].to_numpy() for col in RANGE_FILTER_COLS}
+    arrays.update({col: df[col].cat.codes.to_numpy() for col in CATEGORY_FILTER_COLS})
+    stats = {col: (df[col].min(), df[col].max()) for col in RANGE_FILTER_COLS}
+    stats.update({col: list(df[col].cat.categories) for col in CATEGORY_FILTER_COLS})
+    return df, arrays, stats
+
+
+@st.cache_data(show_spinner=False, max_entries=FILTER_CACHE_ENTRIES)
+def compute_filtered(
+    age_range: tuple,
+    income_range: tuple,
+    cig_range: tuple,
+    sleep_range: tuple,
+    alcohol_range: tuple,
+    pa_range: tuple,
+    selected_ethnicities: tuple,
+    selected_edu: tuple,
+) -> pd.DataFrame:
+    df, arrays, _ = load_shared(DATA_PATH)
+
+    # Build mask over the NumPy arrays (no Gender filter here); ranges
+    # passed as None keep every participant and are skipped. Comparisons
+    # go into one scratch buffer and are folded into the mask in place.
+    mask = np.ones(len(df), dtype=bool)
+    scratch = np.empty_like(mask)
+    ranges = (age_range, income_range, cig_range, sleep_range, alcohol_range, pa_range)
+    for col, bounds in zip(RANGE_FILTER_COLS, ranges):
+        if bounds is not None:
+            values = arrays[col]
+            np.greater_equal(values, bounds[0], out=scratch)
+            np.logical_and(mask, scratch, out=mask)
+            np.less_equal(values, bounds[1], out=scratch)
+            np.logical_and(mask, scratch, out=mask)
+
+    # Multiselect filters compare small integer category codes, not strings
+    selections = (selected_ethnicities, selected_edu)
+    for col, selected in zip(CATEGORY_FILTER_COLS, selections):
+        if selected:
+            selected_codes = df[col].cat.categories.get_indexer(selected)
+            np.logical_and(mask, np.isin(arrays[col], selected_codes), out=mask)
+
+    # Callers only read the selection, so no extra copy is made
+    return df[mask]
+
+
+def apply_filters(stats: dict) -> tuple:
     st.sidebar.header("Filters")
 
     # -------- Demographics ----------
     st.sidebar.subheader("Demographics")
 
     # Age
-    age_min, age_max = int(df["Age"].min()), int(df["Age"].max())
+    age_min, age_max = int(stats["Age"][0]), int(stats["Age"][1])
     age_range = st.sidebar.slider(
         "Age range",
         min_value=age_min,
@@ -106,7 +270,8 @@ def apply_filters(df: pd.DataFrame) -> pd.DataFrame:
     )
 
     # Ethnicity
-    ethnicities = sorted(df["Ethnicity"].dropna().unique())
+    ethnicities = stats["Ethnicity"]
+    all_ethnicities = frozenset(ethnicities)
     selected_ethnicities = st.sidebar.multiselect(
         "Ethnicity",
         options=ethnicities,
@@ -114,7 +279,8 @@ def apply_filters(df: pd.DataFrame) -> pd.DataFrame:
     )
 
     # Education
-    edu_levels = sorted(df["Education_Level"].dropna().unique())
+    edu_levels = stats["Education_Level"]
+    all_edu_levels = frozenset(edu_levels)
     selected_edu = st.sidebar.multiselect(
         "Education level",
         options=edu_levels,
@@ -122,7 +288,7 @@ def apply_filters(df: pd.DataFrame) -> pd.DataFrame:
     )
 
     # Income-to-poverty ratio
-    inc_min, inc_max = float(df["Income_to_Poverty_Ratio"].min()), float(df["Income_to_Poverty_Ratio"].max())
+    inc_min, inc_max = float(stats["Income_to_Poverty_Ratio"][0]), float(stats["Income_to_Poverty_Ratio"][1])
     income_range = st.sidebar.slider(
         "Income-to-poverty ratio",
         min_value=float(round(inc_min, 1)),
@@ -135,7 +301,7 @@ def apply_filters(df: pd.DataFrame) -> pd.DataFrame:
     st.sidebar.subheader("Lifestyle")
 
     # Cigarettes per day
-    c_min, c_max = int(df["Cigarettes_Per_Day"].min()), int(df["Cigarettes_Per_Day"].max())
+    c_min, c_max = int(stats["Cigarettes_Per_Day"][0]), int(stats["Cigarettes_Per_Day"][1])
     cig_range = st.sidebar.slider(
         "Cigarettes per day",
         min_value=c_min,
@@ -145,7 +311,7 @@ def apply_filters(df: pd.DataFrame) -> pd.DataFrame:
     )
 
     # Sleep hours
-    s_min, s_max = int(df["Sleep_Hours"].min()), int(df["Sleep_Hours"].max())
+    s_min, s_max = int(stats["Sleep_Hours"][0]), int(stats["Sleep_Hours"][1])
     sleep_range = st.sidebar.slider(
         "Sleep hours",
         min_value=s_min,
@@ -155,7 +321,7 @@ def apply_filters(df: pd.DataFrame) -> pd.DataFrame:
     )
 
     # Alcohol use frequency
-    a_min, a_max = int(df["Alcohol_Use_Frequency"].min()), int(df["Alcohol_Use_Frequency"].max())
+    a_min, a_max = int(stats["Alcohol_Use_Frequency"][0]), int(stats["Alcohol_Use_Frequency"][1])
     alcohol_range = st.sidebar.slider(
         "Alcohol use frequency (code)",
         min_value=a_min,
@@ -165,7 +331,7 @@ def apply_filters(df: pd.DataFrame) -> pd.DataFrame:
     )
 
     # Physical activity
-    p_min, p_max = int(df["Physical_Activity_Equivalent_Min"].min()), int(df["Physical_Activity_Equivalent_Min"].max())
+    p_min, p_max = int(stats["Physical_Activity_Equivalent_Min"][0]), int(stats["Physical_Activity_Equivalent_Min"][1])
     pa_range = st.sidebar.slider(
         "Physical activity (equivalent minutes per week)",
         min_value=p_min,
@@ -174,40 +340,56 @@ def apply_filters(df: pd.DataFrame) -> pd.DataFrame:
         step=10,
     )
 
-    # Build mask (no Gender filter here)
-    mask = (
-        df["Age"].between(age_range[0], age_range[1])
-        & df["Income_to_Poverty_Ratio"].between(income_range[0], income_range[1])
-        & df["Cigarettes_Per_Day"].between(cig_range[0], cig_range[1])
-        & df["Sleep_Hours"].between(sleep_range[0], sleep_range[1])
-        & df["Alcohol_Use_Frequency"].between(alcohol_range[0], alcohol_range[1])
-        & df["Physical_Activity_Equivalent_Min"].between(pa_range[0], pa_range[1])
+    # Hashable filter signature, used as the cache key downstream.
+    # Filters that keep every participant are passed as None.
+    return (
+        active_range(age_range, age_min, age_max),
+        active_range(income_range, inc_min, inc_max),
+        active_range(cig_range, c_min, c_max),
+        active_range(sleep_range, s_min, s_max),
+        active_range(alcohol_range, a_min, a_max),
+        active_range(pa_range, p_min, p_max),
+        active_selection(selected_ethnicities, all_ethnicities),
+        active_selection(selected_edu, all_edu_levels),
     )
 
-    if selected_ethnicities:
-        mask &= df["Ethnicity"].isin(selected_ethnicities)
-    if selected_edu:
-        mask &= df["Education_Level"].isin(selected_edu)
-
-    return df[mask].copy()
 
-
-def prevalence_table(df: pd.DataFrame) -> pd.DataFrame:
-    rows = []
-    for col in OUTCOME_COLS:
-        s = df[col].str.upper()
-        prev = (s == "YES").mean() * 100
-        rows.append(
-            {"Outcome": nice_label(col), "Prevalence (%)": round(prev, 1)}
-        )
-    prev_df = pd.DataFrame(rows)
-    return prev_df.sort_values("Prevalence (%)", ascending=False)
+# The leading underscore keeps Streamlit from hashing the frame; the
+# filter signature identifies it.
+@st.cache_data(show_spinner=False, max_entries=FILTER_CACHE_ENTRIES)
+def prevalence_table(filter_key: tuple, _df: pd.DataFrame) -> pd.DataFrame:
+    # One reduction over the N x 8 boolean outcome matrix
+    prev = _df[OUTCOME_COLS].to_numpy().mean(axis=0) * 100
+    prev_df = pd.DataFrame(
+        {
+            "Outcome": [nice_label(col) for col in OUTCOME_COLS],
+            "Prevalence (%)": np.round(prev, 1),
+        }
+    )
+    return prev_df.sort_values("Prevalence (%)", ascending=False, ignore_index=True)
+
+
+@st.cache_data(show_spinner=False, max_entries=FILTER_CACHE_ENTRIES)
+def lifestyle_prevalence(
+    filter_key: tuple, life_var: str, outcome_col: str, _df: pd.DataFrame
+) -> pd.DataFrame:
+    # One row per lifestyle bin and gender, grouped on the integer bin index
+    starts, codes = lifestyle_bins(_df[life_var].to_numpy())
+    group_prev = (
+        _df.groupby([codes, "Gender"], observed=True)[outcome_col]
+        .mean()
+        .rename("prevalence")
+        .rename_axis(["life_bin", "Gender"])
+        .reset_index()
+    )
+    group_prev["life_bin"] = starts[group_prev["life_bin"].to_numpy()]
+    return group_prev
 
 
 # -----------------------------
 # Main app
 # -----------------------------
-df = load_data(DATA_PATH)
+_, _, filter_stats = load_shared(DATA_PATH)
 
 st.title("Lifestyle & Comorbidity Explorer")
 st.markdown(
@@ -220,7 +402,8 @@ This dashboard lets you interactively explore how **lifestyle behaviours**
 """
 )
 
-filtered = apply_filters(df)
+filter_key = apply_filters(filter_stats)
+filtered = compute_filtered(*filter_key)
 
 st.markdown(f"### Current selection: {len(filtered):,} participants")
 
@@ -238,7 +421,7 @@ col1, col2, col3 = st.columns(3)
 with col1:
     st.metric(
         "Any comorbidity (≥1 condition)",
-        f"{(filtered['Any_Comorbidity'] == 'Yes').mean() * 100:.1f} %",
+        f"{filtered['Any_Comorbidity_Bool'].mean() * 100:.1f} %",
     )
 with col2:
     st.metric(
@@ -251,7 +434,7 @@ with col3:
         int(filtered["Comorbidity_Count"].max()),
     )
 
-prev_df = prevalence_table(filtered)
+prev_df = prevalence_table(filter_key, filtered)
 
 prev_chart = (
     alt.Chart(prev_df)
@@ -287,36 +470,86 @@ genders_in_data = (
     .unique()
 )
 
-# Single plot: boxes + points, grouped and colored by gender
+# Single plot: boxes + points, grouped and colored by gender.
+# Only the encoded columns are sent to the browser.
+metab_df = filtered[["Comorbidity_Count", "Gender", cm_y_var]]
+
+# Boxes summarise everyone; the jitter layer is capped at a random sample
+if len(metab_df) <= MAX_JITTER_POINTS:
+    points_df = metab_df
+else:
+    points_df = metab_df.sample(MAX_JITTER_POINTS, random_state=0)
+
+count_x = alt.X(
+    "Comorbidity_Count:O",
+    title="Number of comorbid conditions"
+)
+# horizontally dodge male/female within each count
+gender_offset = alt.XOffset("Gender:N")
+gender_color = alt.Color(
+    "Gender:N",
+    title="Gender",
+    scale=alt.Scale(
+        domain=["Female", "Male"],           # adjust if your labels differ
+        range=["#ff69b4", "#1f77b4"]         # pink for female, blue for male
+    ),
+)
+y_title = nice_label(cm_y_var)
+
 base = (
-    alt.Chart(filtered)
+    alt.Chart(points_df)
     .encode(
-        x=alt.X(
-            "Comorbidity_Count:O",
-            title="Number of comorbid conditions"
-        ),
-        # horizontally dodge male/female within each count
-        xOffset=alt.XOffset("Gender:N"),
+        x=count_x,
+        xOffset=gender_offset,
         y=alt.Y(
             cm_y_var,
-            title=nice_label(cm_y_var)
+            title=y_title
         ),
-        color=alt.Color(
-            "Gender:N",
-            title="Gender",
-            scale=alt.Scale(
-                domain=["Female", "Male"],           # adjust if your labels differ
-                range=["#ff69b4", "#1f77b4"]         # pink for female, blue for male
-            ),
-        ),
-        tooltip=["Gender", "Comorbidity_Count:O", cm_y_var],
+        color=gender_color,
+        tooltip=["Gender", "Comorbidity_Count:O", alt.Tooltip(cm_y_var, format=".6~g")],
     )
 )
 
-box = base.mark_boxplot()
+# Box statistics are computed here, so the box layers get one row per box
+box_df = box_summary(metab_df, cm_y_var, ["Comorbidity_Count", "Gender"])
+box_base = alt.Chart(box_df).encode(x=count_x, xOffset=gender_offset)
+
+# Every value outside its whiskers is drawn, as mark_boxplot did, whether
+# or not it made it into the jitter sample
+whisker_ends = metab_df.join(
+    box_df.set_index(["Comorbidity_Count", "Gender"])[["lower", "upper"]],
+    on=["Comorbidity_Count", "Gender"],
+)
+outliers_df = metab_df[
+    ~whisker_ends[cm_y_var].between(whisker_ends["lower"], whisker_ends["upper"])
+]
+
+whiskers = box_base.mark_rule().encode(
+    y=alt.Y("lower:Q", title=y_title),
+    y2="upper:Q",
+)
+box = box_base.mark_bar(size=14).encode(
+    y=alt.Y("q1:Q", title=y_title),
+    y2="q3:Q",
+    color=gender_color,
+    tooltip=[
+        "Gender:N",
+        "Comorbidity_Count:O",
+        alt.Tooltip("count:Q", title="n"),
+        alt.Tooltip("upper:Q", title="Upper whisker", format=".6~g"),
+        alt.Tooltip("q3:Q", title="Q3", format=".6~g"),
+        alt.Tooltip("median:Q", title="Median", format=".6~g"),
+        alt.Tooltip("q1:Q", title="Q1", format=".6~g"),
+        alt.Tooltip("lower:Q", title="Lower whisker", format=".6~g"),
+    ],
+)
+median = box_base.mark_tick(color="white", size=14).encode(
+    y=alt.Y("median:Q", title=y_title),
+)
+outliers = base.mark_point().properties(data=outliers_df)
 points = base.mark_circle(size=20, opacity=0.3)
 
-metab_chart = (box + points).properties(height=350)
+metab_chart = (whiskers + box + median + outliers + points).properties(height=350)
 
 st.altair_chart(metab_chart, use_container_width=True)
 
@@ -337,9 +570,7 @@ if selected_outcomes:
     long_frames = []
     for cond in selected_outcomes:
         # keep only participants with this condition = Yes
-        tmp = filtered[
-            filtered[cond].astype(str).str.upper() == "YES"
-        ][[cm_y_var, "Gender"]].copy()
+        tmp = filtered[filtered[cond]][[cm_y_var, "Gender"]].copy()
         tmp["Condition"] = nice_label(cond)
         long_frames.append(tmp)
 
@@ -372,7 +603,7 @@ if selected_outcomes:
                             range=["#ff69b4", "#1f77b4"]
                         ),
                     ),
-                    tooltip=["Gender:N", "Condition:N", cm_y_var]
+                    tooltip=["Gender:N", "Condition:N", alt.Tooltip(cm_y_var, format=".6~g")]
                 )
                 .properties(height=350)
             )
@@ -405,26 +636,18 @@ outcome_prev = st.selectbox(
     format_func=lambda v: "Any comorbidity (≥1)" if v == "Any_Comorbidity" else nice_label(v),
 )
 
-tmp = filtered.copy()
-
 if outcome_prev == "Any_Comorbidity":
-    tmp["Outcome_Num"] = (tmp["Any_Comorbidity"] == "Yes").astype(int)
+    outcome_col = "Any_Comorbidity_Bool"
     outcome_title = "Any comorbidity prevalence"
 else:
-    tmp["Outcome_Num"] = (tmp[outcome_prev].astype(str).str.upper() == "YES").astype(int)
+    outcome_col = outcome_prev
     outcome_title = f"{nice_label(outcome_prev)} prevalence"
 
+# Aggregate here so only one row per bin and gender is sent to the browser
+group_prev = lifestyle_prevalence(filter_key, life_var, outcome_col, filtered)
+
 prev_chart = (
-    alt.Chart(tmp)
-    .transform_bin(
-        bin=alt.Bin(maxbins=15),
-        field=life_var,
-        as_="life_bin"
-    )
-    .transform_aggregate(
-        prevalence="mean(Outcome_Num)",
-        groupby=["life_bin", "Gender"]
-    )
+    alt.Chart(group_prev)
     .mark_line(point=True)
     .encode(
         x=alt.X(